@@ -1,3 +1,4 @@
+import io
 import streamlit as st
 import pandas as pd
 import numpy as np
@@ -190,6 +191,186 @@ def load_models():
         st.error(f"⚠️ Error loading models: {e}")
         return None
 
+FEATURE_COLUMNS = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
+FEATURE_LABELS = ["Nitrogen", "Phosphorus", "Potassium", "Temperature", "Humidity", "pH", "Rainfall"]
+
+def build_tree_paths(model):
+    """Flatten every root-to-leaf path of a tree model into padded arrays for TreeSHAP.
+
+    Splits on the same feature are merged into one (lower, upper] interval with the
+    product of their cover fractions, so each path holds at most one entry per feature.
+    Forest leaves are weighted by 1 / n_trees, matching predict_proba's averaging.
+    """
+    estimators = model.estimators_ if hasattr(model, "estimators_") else [model]
+    weight = 1.0 / len(estimators)
+    n_features = model.n_features_in_
+
+    leaves = []
+    base_value = 0.0
+    for estimator in estimators:
+        tree = estimator.tree_
+        values = tree.value[:, 0, :] / tree.value[:, 0, :].sum(axis=1, keepdims=True)
+        cover = tree.weighted_n_node_samples
+        base_value = base_value + weight * values[0]
+
+        stack = [(0, {})]
+        while stack:
+            node, path = stack.pop()
+            left, right = tree.children_left[node], tree.children_right[node]
+            if left == -1:
+                leaves.append((path, weight * values[node]))
+                continue
+            feature, threshold = tree.feature[node], tree.threshold[node]
+            lower, upper, zero_fraction = path.get(feature, (-np.inf, np.inf, 1.0))
+            for child, bounds in ((left, (lower, min(upper, threshold))), (right, (max(lower, threshold), upper))):
+                child_path = dict(path)
+                child_path[feature] = (*bounds, zero_fraction * cover[child] / cover[node])
+                stack.append((child, child_path))
+
+    # Longest paths first, so the leaves with a real split at position j are a prefix
+    leaves.sort(key=lambda leaf: len(leaf[0]), reverse=True)
+    n_leaves = len(leaves)
+    depth = max(1, len(leaves[0][0]))
+    # Arrays are laid out (path position, leaf) so the per-position loops in
+    # tree_shap_values work on contiguous blocks. Padding slots get an empty
+    # interval and a zero fraction of 1, i.e. a factor of 1 in the path polynomial.
+    features = np.zeros((depth, n_leaves), dtype=np.intp)
+    lower = np.full((depth, n_leaves), np.inf)
+    upper = np.full((depth, n_leaves), np.inf)
+    zero_fractions = np.ones((depth, n_leaves))
+    feature_masks = np.zeros((n_features, depth, n_leaves))
+    path_lengths = np.zeros(n_leaves, dtype=np.intp)
+    leaf_values = np.zeros((n_leaves, len(base_value)))
+
+    for i, (path, value) in enumerate(leaves):
+        path_lengths[i] = len(path)
+        leaf_values[i] = value
+        for j, (feature, (lo, hi, z)) in enumerate(path.items()):
+            features[j, i] = feature
+            lower[j, i], upper[j, i], zero_fractions[j, i] = lo, hi, z
+            feature_masks[feature, j, i] = 1.0
+
+    # Shapley weights k! (d - k - 1)! / d! for a path of d unique features
+    factorials = np.cumprod(np.concatenate(([1.0], np.arange(1, depth + 1))))
+    k = np.arange(depth)[:, None]
+    d = path_lengths[None, :]
+    shapley_weights = np.where(
+        k < d,
+        factorials[k] * factorials[np.clip(d - k - 1, 0, None)] / factorials[d],
+        0.0,
+    )
+
+    return {
+        "classes": model.classes_,
+        "base_value": base_value,
+        "features": features,
+        "lower": lower[..., None],
+        "upper": upper[..., None],
+        "zero_fractions": zero_fractions[..., None],
+        "feature_masks": feature_masks,
+        "shapley_weights": shapley_weights[..., None],
+        "leaf_values": leaf_values,
+        "active_leaves": [int((path_lengths > j).sum()) for j in range(depth)],
+    }
+
+def tree_shap_values(paths, X, max_chunk_floats=2**21):
+    """Exact path-dependent TreeSHAP values for a batch, shape (n_samples, n_features, n_classes).
+
+    For each leaf the path polynomial prod_j (z_j + o_j * t) is built once and every
+    feature is unwound from it, giving O(leaves * depth^2) work per sample that is
+    vectorized across samples, leaves and path positions. Rows are processed in chunks
+    sized so the path polynomials hold at most max_chunk_floats values.
+    """
+    # Trees compare float32 inputs against their thresholds
+    X = np.asarray(X, dtype=np.float32).astype(np.float64)
+    z = paths["zero_fractions"]
+    weights = paths["shapley_weights"]
+    depth = len(z)
+    active = paths["active_leaves"]
+    chunk_size = max(1, max_chunk_floats // ((depth + 1) * len(paths["leaf_values"])))
+
+    phi = np.zeros((len(X), len(paths["feature_masks"]), len(paths["classes"])))
+    for start in range(0, len(X), chunk_size):
+        x = X[start:start + chunk_size].T[paths["features"]]
+        one = ((x > paths["lower"]) & (x <= paths["upper"])).astype(np.float64)
+
+        # Coefficients of prod_j (z_j + o_j * t), lowest degree first. Updated in
+        # place from the top degree down so no chunk-sized temporaries are allocated.
+        poly = np.zeros((depth + 1,) + one.shape[1:])
+        poly[0] = 1.0
+        scratch = np.empty(one.shape[1:])
+        for j, n in enumerate(active):
+            for k in range(j + 1, 0, -1):
+                poly[k, :n] *= z[j, :n]
+                poly[k, :n] += np.multiply(poly[k - 1, :n], one[j, :n], out=scratch[:n])
+            poly[0, :n] *= z[j, :n]
+
+        # Unwind feature i: divide by (z_i + t) when o_i = 1, by z_i when o_i = 0.
+        # Working one path position at a time keeps the arrays small enough to stay in cache.
+        weighted_sum = np.zeros_like(scratch)
+        for k in range(depth):
+            weighted_sum += np.multiply(poly[k], weights[k], out=scratch)
+        contributions = np.zeros_like(one)
+        quotient = np.empty_like(scratch)
+        unwound = np.empty_like(scratch)
+        for i, n in enumerate(active):
+            quotient[:n] = poly[depth, :n]
+            unwound[:n] = 0.0
+            for k in range(depth - 1, -1, -1):
+                unwound[:n] += np.multiply(quotient[:n], weights[k, :n], out=scratch[:n])
+                quotient[:n] *= z[i, :n]
+                np.subtract(poly[k, :n], quotient[:n], out=quotient[:n])
+            np.divide(weighted_sum[:n], z[i, :n], out=scratch[:n])
+            np.copyto(unwound[:n], scratch[:n], where=one[i, :n] == 0)
+            np.multiply(one[i, :n] - z[i, :n], unwound[:n], out=contributions[i, :n])
+
+        per_leaf = np.einsum("djs,fdj->fsj", contributions, paths["feature_masks"], optimize=True)
+        phi[start:start + chunk_size] = (per_leaf @ paths["leaf_values"]).transpose(1, 0, 2)
+    return phi
+
+@st.cache_resource
+def load_explainers():
+    models = load_models()
+    if not models:
+        return {}
+    return {name: build_tree_paths(model) for name, model in models.items() if name != "KNN"}
+
+@st.cache_data(show_spinner=False)
+def predict_batch(file_bytes, model_name):
+    """Predict a crop for every valid row of an uploaded batch, adding shap_* columns for tree models.
+
+    Rows with missing or non-numeric readings are left out and their 1-based row
+    numbers returned, since the trees would silently route NaN down one branch.
+    Cached on the file contents so reruns of the page don't repeat the TreeSHAP work.
+    """
+    batch_df = pd.read_csv(io.BytesIO(file_bytes))
+    missing_columns = [col for col in FEATURE_COLUMNS if col not in batch_df.columns]
+    if missing_columns:
+        raise ValueError(f"Missing columns: {', '.join(missing_columns)}")
+
+    batch_features = batch_df[FEATURE_COLUMNS].apply(pd.to_numeric, errors="coerce")
+    valid_rows = np.isfinite(batch_features.to_numpy(dtype=float)).all(axis=1)
+    skipped_rows = (np.flatnonzero(~valid_rows) + 1).tolist()
+    if not valid_rows.any():
+        raise ValueError("No rows with complete numeric readings found in the uploaded file")
+
+    results_df = batch_df[valid_rows].reset_index(drop=True)
+    batch_features = batch_features[valid_rows]
+    predictions = load_models()[model_name].predict(batch_features)
+    results_df["predicted_crop"] = predictions
+
+    explainers = load_explainers()
+    if model_name in explainers:
+        paths = explainers[model_name]
+        class_lookup = {crop: i for i, crop in enumerate(paths["classes"])}
+        class_idx = np.array([class_lookup[crop] for crop in predictions])
+        phi = tree_shap_values(paths, batch_features.to_numpy())
+        attributions = phi[np.arange(len(phi)), :, class_idx]
+        for col, values in zip(FEATURE_COLUMNS, attributions.T):
+            results_df[f"shap_{col}"] = values
+
+    return results_df, skipped_rows
+
 st.set_page_config(
     page_title="Sow Smart - Crop Recommendation",
     page_icon="🌾",
@@ -218,6 +399,7 @@ with st.sidebar:
 
 # Load Models
 models = load_models()
+explainers = load_explainers()
 
 # Tabs
 tab1, tab2, tab3, tab4 = st.tabs(["🔮 Predict Crop", "📊 Data Insights", "🧠 Model Selection", "📚 Crop Guide"])
@@ -270,6 +452,28 @@ with tab1:
         </div>
         """, unsafe_allow_html=True)
 
+        # Feature Attributions
+        if selected_model_name in explainers:
+            paths = explainers[selected_model_name]
+            class_idx = list(paths["classes"]).index(result)
+            attributions = tree_shap_values(paths, data_point)[0, :, class_idx]
+            base_prob = paths["base_value"][class_idx]
+
+            st.markdown('<p class="section-header">🔍 What Drove This Recommendation</p>', unsafe_allow_html=True)
+            order = np.argsort(np.abs(attributions))
+            fig, ax = plt.subplots(figsize=(10, 4))
+            colors = ['#52b788' if value >= 0 else '#f4a261' for value in attributions[order]]
+            ax.barh(np.array(FEATURE_LABELS)[order], attributions[order] * 100, color=colors, edgecolor='#2d6a4f', linewidth=1.2)
+            ax.axvline(0, color='#2d6a4f', linewidth=1)
+            ax.set_title(f"Contribution to {result.title()} Probability", fontsize=16, fontweight="bold", color='#2d6a4f')
+            ax.set_xlabel("Change in probability (percentage points)", fontsize=12)
+            ax.grid(alpha=0.3, linestyle='--', axis='x')
+            plt.tight_layout()
+            st.pyplot(fig)
+            st.caption(f"Average probability of {result} is {base_prob:.1%}; these measurements move it to {base_prob + attributions.sum():.1%}.")
+        else:
+            st.info(f"ℹ️ Feature attributions are available for tree-based models only, not {selected_model_name}.")
+
         # Input Summary
         st.markdown('<p class="section-header">📋 Input Summary</p>', unsafe_allow_html=True)
         
@@ -287,6 +491,39 @@ with tab1:
             st.metric("🌧️ Rainfall", f"{rainfall} cm")
             st.metric("🤖 Model", selected_model_name)
 
+    # Batch Predictions
+    st.markdown("<br>", unsafe_allow_html=True)
+    st.markdown('<p class="section-header">📦 Batch Predictions</p>', unsafe_allow_html=True)
+
+    batch_file = st.file_uploader("📁 Upload Soil & Climate Readings (CSV)", type=["csv"], key="batch", help=f"Required columns: {', '.join(FEATURE_COLUMNS)}")
+
+    if batch_file and models:
+        try:
+            with st.spinner("🔄 Analyzing batch readings..."):
+                results_df, skipped_rows = predict_batch(batch_file.getvalue(), selected_model_name)
+        except (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError):
+            st.error("⚠️ Could not read the uploaded file. Please upload a non-empty CSV file.")
+        except ValueError as e:
+            st.error(f"⚠️ {e}")
+        else:
+            if skipped_rows:
+                shown_rows = ", ".join(map(str, skipped_rows[:10])) + (", ..." if len(skipped_rows) > 10 else "")
+                st.error(f"⚠️ Skipped {len(skipped_rows)} row(s) with missing or non-numeric values: {shown_rows}")
+
+            st.markdown(f"#### 📈 Results Preview ({len(results_df)} rows)")
+            st.dataframe(results_df.head(10), use_container_width=True)
+            if selected_model_name not in explainers:
+                st.info(f"ℹ️ Feature attributions are available for tree-based models only, not {selected_model_name}.")
+
+            st.download_button(
+                "⬇️ Download Results (CSV)",
+                data=results_df.to_csv(index=False),
+                file_name="crop_predictions.csv",
+                mime="text/csv",
+                on_click="ignore",
+                use_container_width=True
+            )
+
 # TAB 2: Data Insights
 with tab2:
     st.markdown('<p class="section-header">📊 Dataset Analysis & Visualizations</p>', unsafe_allow_html=True)